@@ -1,14 +1,18 @@
 import logging
 import os
 import sys
+import time
+from collections import deque
+from typing import Optional
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from langchain_ollama.llms import OllamaLLM
 from langchain_core.prompts import ChatPromptTemplate
-from langchain.chains import LLMChain
 from langchain_core.output_parsers import StrOutputParser
 from vector import search_knowledge
+from routing import env_int, choose_route, fallback_route, retrieval_confidence, p95
 
 logging.basicConfig(
     level=logging.INFO,
@@ -43,42 +47,113 @@ class Source(BaseModel):
 class QueryResponse(BaseModel):
     answer: str
     sources: list[Source]
+    route: Optional[str] = None
+    fallback_from: Optional[str] = None
+    latency_ms: Optional[float] = None
 
 llm = None
 chain = None
 
+# Generation profiles. "detailed" is the original llama2 RAG chain; "concise" and "fast"
+# trade answer length (and for "fast", model size) for latency. Each can be overridden
+# through environment variables, e.g. FAST_MODEL=phi3:mini or CONCISE_NUM_PREDICT=200.
+DETAILED_TEMPLATE = (
+    "You are a helpful and informative Smart City Assistant.\n"
+    "Your primary role is to provide comprehensive and detailed answers based on the information available in the provided context.\n\n"
+    "Please thoroughly review the context below to answer the user's question.\n"
+    "Explain the key aspects, provide relevant details, and aim for a clear and elaborate response.\n"
+    "If the context contains specific steps, lists, or multiple pieces of information related to the question, try to include them in your answer.\n\n"
+    "If the information is not available in the context to fully answer the question, or if the context is limited, \n"
+    "clearly state what information you could find and what remains unanswered based on the provided context. \n"
+    "Do not invent information or answer outside of the provided context.\n\n"
+    "Context:\n"
+    "{context}\n\n"
+    "Question: {question}\n\n"
+    "Detailed Answer:"
+)
+
+SHORT_TEMPLATE = (
+    "You are a helpful Smart City Assistant.\n"
+    "Answer the user's question in two or three sentences using only the context below.\n"
+    "If the context does not contain the answer, say so briefly. Do not invent information.\n\n"
+    "Context:\n"
+    "{context}\n\n"
+    "Question: {question}\n\n"
+    "Short Answer:"
+)
+
+GENERATION_PROFILES = {
+    "detailed": {
+        "model": os.getenv("DETAILED_MODEL", "llama2"),
+        "num_predict": env_int("DETAILED_NUM_PREDICT", None),
+        "template": DETAILED_TEMPLATE,
+    },
+    "concise": {
+        "model": os.getenv("CONCISE_MODEL", "llama2"),
+        "num_predict": env_int("CONCISE_NUM_PREDICT", 256),
+        "template": SHORT_TEMPLATE,
+    },
+    "fast": {
+        "model": os.getenv("FAST_MODEL", "llama3.2:1b"),
+        "num_predict": env_int("FAST_NUM_PREDICT", 128),
+        "template": SHORT_TEMPLATE,
+    },
+}
+
+chains = {}
+
 try:
-    logger.info("Initializing LLM for RAG...")
+    logger.info("Initializing LLMs for RAG...")
     ollama_base_url = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
-    llm = OllamaLLM(model="llama2", base_url=ollama_base_url)
-    logger.info(f"LLM initialized successfully with base_url: {ollama_base_url}")
-
-    template = (
-        "You are a helpful and informative Smart City Assistant.\n"
-        "Your primary role is to provide comprehensive and detailed answers based on the information available in the provided context.\n\n"
-        "Please thoroughly review the context below to answer the user's question.\n"
-        "Explain the key aspects, provide relevant details, and aim for a clear and elaborate response.\n"
-        "If the context contains specific steps, lists, or multiple pieces of information related to the question, try to include them in your answer.\n\n"
-        "If the information is not available in the context to fully answer the question, or if the context is limited, \n"
-        "clearly state what information you could find and what remains unanswered based on the provided context. \n"
-        "Do not invent information or answer outside of the provided context.\n\n"
-        "Context:\n"
-        "{context}\n\n"
-        "Question: {question}\n\n"
-        "Detailed Answer:"
-    )
-    prompt_template = ChatPromptTemplate.from_template(template)
-
-    chain = LLMChain(
-        llm=llm,
-        prompt=prompt_template,
-        output_parser=StrOutputParser()
-    )
-    logger.info("LLM RAG chain created successfully with updated prompt for detailed answers.")
+
+    for profile_name, profile in GENERATION_PROFILES.items():
+        try:
+            llm_kwargs = {"model": profile["model"], "base_url": ollama_base_url}
+            if profile["num_predict"] is not None:
+                llm_kwargs["num_predict"] = profile["num_predict"]
+            profile_llm = OllamaLLM(**llm_kwargs)
+            chains[profile_name] = ChatPromptTemplate.from_template(profile["template"]) | profile_llm | StrOutputParser()
+            if profile_name == "detailed":
+                llm = profile_llm
+            logger.info(f"Profile '{profile_name}' initialized with model {profile['model']} (num_predict={profile['num_predict']}).")
+        except Exception as e:
+            logger.error(f"Error initializing generation profile '{profile_name}': {e}", exc_info=True)
+
+    chain = chains.get("detailed")
+    logger.info(f"LLM RAG chains created with base_url: {ollama_base_url}. Available profiles: {list(chains)}")
 
 except Exception as e:
     logger.error(f"Error during LLM or RAG Chain initialization: {e}", exc_info=True)
 
+in_flight_requests = 0
+route_latencies = {name: deque(maxlen=500) for name in GENERATION_PROFILES}
+route_fallbacks = {name: 0 for name in GENERATION_PROFILES}
+request_latencies = deque(maxlen=500)
+
+async def timed_invoke(route: str, payload: dict) -> str:
+    """Invoke a route's chain in the threadpool, recording its latency whether it succeeds or fails"""
+    start = time.perf_counter()
+    try:
+        return await run_in_threadpool(chains[route].invoke, payload)
+    finally:
+        route_latencies[route].append((time.perf_counter() - start) * 1000)
+
+async def generate_answer(route: str, payload: dict, load: int):
+    """Generate an answer on the chosen route, stepping down the fallback order if a profile fails"""
+    chosen_route = route
+    models = {name: GENERATION_PROFILES[name]["model"] for name in chains}
+    while True:
+        try:
+            answer = await timed_invoke(route, payload)
+            return answer, route, (chosen_route if route != chosen_route else None)
+        except Exception as e:
+            next_route = fallback_route(route, models, load)
+            if next_route is None:
+                raise
+            logger.warning(f"Route '{route}' failed ({e}), falling back to '{next_route}'.", exc_info=True)
+            route_fallbacks[route] += 1
+            route = next_route
+
 def format_rag_context(documents: dict) -> str:
     if not documents:
         return "No relevant information found in the knowledge base."
@@ -111,16 +186,39 @@ async def health_check():
     logger.info("Health check endpoint called.")
     return {"status": "healthy", "llm_initialized": llm is not None, "chain_initialized": chain is not None}
 
+@app.get("/routing", summary="Generation routing statistics", tags=["General"])
+async def routing_stats():
+    return {
+        "in_flight_requests": in_flight_requests,
+        "requests": len(request_latencies),
+        "p95_latency_ms": p95(request_latencies),
+        "routes": {
+            name: {
+                "model": GENERATION_PROFILES[name]["model"],
+                "num_predict": GENERATION_PROFILES[name]["num_predict"],
+                "available": name in chains,
+                "requests": len(latencies),
+                "p95_latency_ms": p95(latencies),
+                "fallbacks": route_fallbacks[name],
+            }
+            for name, latencies in route_latencies.items()
+        },
+    }
+
 @app.post("/query", response_model=QueryResponse, summary="Process a user query using RAG", tags=["Smart City Assistant"])
 async def handle_query(query_request: QueryRequest):
+    global in_flight_requests
     logger.info(f"Received query for RAG: {query_request.text}")
-    if not chain:
+    if not chains:
         logger.error("RAG Chain not initialized. Cannot process query.")
         raise HTTPException(status_code=500, detail="RAG chain is not initialized. Please check server logs.")
 
+    in_flight_requests += 1
+    request_start = time.perf_counter()
+    route = None
     try:
         logger.info(f"Searching knowledge base for: {query_request.text}")
-        retrieved_docs_dict = search_knowledge(query_request.text, top_k=3)
+        retrieved_docs_dict = await run_in_threadpool(search_knowledge, query_request.text, k=3)
 
         if not retrieved_docs_dict or not retrieved_docs_dict.get('documents') or not retrieved_docs_dict['documents'][0]:
             logger.info("No relevant documents found in knowledge base.")
@@ -129,10 +227,13 @@ async def handle_query(query_request: QueryRequest):
         formatted_context = format_rag_context(retrieved_docs_dict)
         logger.info(f"Context for RAG: {formatted_context[:500]}...")
 
+        load = in_flight_requests - 1
+        route = choose_route(query_request.text, retrieval_confidence(retrieved_docs_dict), load, chains)
+
         response_payload = {"context": formatted_context, "question": query_request.text}
-        logger.info("Invoking RAG chain...")
-        answer = chain.invoke(response_payload)
-        logger.info(f"RAG chain answer: {answer}")
+        logger.info(f"Invoking RAG chain '{route}'...")
+        answer, route, fallback_from = await generate_answer(route, response_payload, load)
+        logger.info(f"RAG chain '{route}' answer: {answer}")
 
         response_sources = []
         if retrieved_docs_dict and retrieved_docs_dict.get('metadatas'):
@@ -149,13 +250,19 @@ async def handle_query(query_request: QueryRequest):
                  if len(response_sources) >= 3:
                      break
 
-        return QueryResponse(answer=str(answer), sources=response_sources)
+        latency_ms = (time.perf_counter() - request_start) * 1000
+        return QueryResponse(answer=answer, sources=response_sources, route=route, fallback_from=fallback_from, latency_ms=round(latency_ms, 1))
 
     except Exception as e:
         logger.error(f"Error processing RAG query: {e}", exc_info=True)
         import traceback
         logger.error(traceback.format_exc())
         raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {str(e)}")
+    finally:
+        in_flight_requests -= 1
+        latency_ms = (time.perf_counter() - request_start) * 1000
+        request_latencies.append(latency_ms)
+        logger.info(f"Query finished in {latency_ms:.0f} ms (route: {route}).")
 
 if __name__ == "__main__":
     import uvicorn
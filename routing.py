@@ -0,0 +1,104 @@
+import logging
+import os
+import re
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+def env_int(name: str, default: Optional[int]) -> Optional[int]:
+    """Read an integer environment variable, falling back to the default if it is unset or malformed"""
+    value = os.getenv(name)
+    if value is None or value == "":
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        logger.warning(f"Invalid integer for {name}: {value!r}. Using default {default}.")
+        return default
+
+def env_float(name: str, default: float) -> float:
+    """Read a float environment variable, falling back to the default if it is unset or malformed"""
+    value = os.getenv(name)
+    if value is None or value == "":
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        logger.warning(f"Invalid number for {name}: {value!r}. Using default {default}.")
+        return default
+
+# Routing thresholds.
+HIGH_LOAD_THRESHOLD = env_int("ROUTER_HIGH_LOAD", 4)
+CONFIDENT_RELEVANCE = env_float("ROUTER_CONFIDENT_RELEVANCE", 0.6)
+COMPLEX_QUERY_WORDS = env_int("ROUTER_COMPLEX_QUERY_WORDS", 18)
+
+DETAIL_REQUEST_PATTERN = re.compile(
+    r"\b(in detail|detailed|elaborate|explain|in depth|step[- ]by[- ]step|thoroughly|comprehensive)\b",
+    re.IGNORECASE
+)
+COMPLEX_QUERY_PATTERN = re.compile(
+    r"\b(why|compare|comparison|difference|differences|versus|vs\.?|pros and cons|process|procedure|requirements)\b",
+    re.IGNORECASE
+)
+
+def query_complexity(question: str) -> str:
+    """Classify a question as 'detail' (explicitly asks for detail), 'complex' or 'simple'"""
+    if DETAIL_REQUEST_PATTERN.search(question):
+        return "detail"
+    if (len(question.split()) >= COMPLEX_QUERY_WORDS
+            or question.count("?") > 1
+            or COMPLEX_QUERY_PATTERN.search(question)):
+        return "complex"
+    return "simple"
+
+def retrieval_confidence(documents: dict) -> float:
+    """Best relevance score among the retrieved documents, 0.0 if none were scored"""
+    scores = documents.get('scores') if isinstance(documents, dict) else None
+    if not scores or not scores[0]:
+        return 0.0
+    return max(scores[0])
+
+def choose_route(question: str, confidence: float, load: int, available) -> str:
+    """Pick a generation profile from query complexity, retrieval confidence and current load"""
+    complexity = query_complexity(question)
+    high_load = load >= HIGH_LOAD_THRESHOLD
+
+    if complexity == "detail":
+        route = "detailed"
+    elif complexity == "complex":
+        route = "concise" if high_load else "detailed"
+    elif high_load or confidence >= CONFIDENT_RELEVANCE:
+        route = "fast"
+    else:
+        route = "concise"
+
+    if route not in available:
+        route = "detailed" if "detailed" in available else next(iter(available))
+    logger.info(f"Routing decision: complexity={complexity}, confidence={confidence:.2f}, load={load} -> {route}")
+    return route
+
+# Lighter profiles fall back one step at a time, towards "detailed".
+FALLBACK_ORDER = ["fast", "concise", "detailed"]
+
+def fallback_route(failed_route: str, models: dict, load: int) -> Optional[str]:
+    """Next profile to try after failed_route fails, or None if there is nothing worth retrying on.
+
+    models maps each available profile to its model name. Profiles on the same model as the
+    failed one are skipped, and "detailed" is not used while the server is busy.
+    """
+    if failed_route not in FALLBACK_ORDER:
+        return None
+    failed_model = models.get(failed_route)
+    for route in FALLBACK_ORDER[FALLBACK_ORDER.index(failed_route) + 1:]:
+        if route == "detailed" and load >= HIGH_LOAD_THRESHOLD:
+            break
+        if route in models and models[route] != failed_model:
+            return route
+    return None
+
+def p95(values) -> Optional[float]:
+    """95th percentile (nearest rank) of the given values, None if there are none"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))]
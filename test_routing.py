@@ -0,0 +1,90 @@
+import routing
+from routing import choose_route, env_float, env_int, fallback_route, p95, query_complexity, retrieval_confidence
+
+ALL_ROUTES = {"detailed": None, "concise": None, "fast": None}
+MODELS = {"detailed": "llama2", "concise": "llama2", "fast": "llama3.2:1b"}
+BUSY = routing.HIGH_LOAD_THRESHOLD
+IDLE = 0
+CONFIDENT = routing.CONFIDENT_RELEVANCE
+UNSURE = routing.CONFIDENT_RELEVANCE - 0.3
+
+SIMPLE = "What are the library opening hours?"
+COMPLEX = "What is the difference between a residential and a commercial parking permit?"
+DETAIL = "Explain how the recycling pickup works"
+
+
+def test_query_complexity():
+    assert query_complexity(SIMPLE) == "simple"
+    assert query_complexity(COMPLEX) == "complex"
+    assert query_complexity(DETAIL) == "detail"
+    assert query_complexity("Where is city hall? When does it open?") == "complex"
+    assert query_complexity(" ".join(["word"] * routing.COMPLEX_QUERY_WORDS)) == "complex"
+
+
+def test_only_explicit_detail_requests_are_detail():
+    assert query_complexity("Describe the bus network in detail") == "detail"
+    assert query_complexity("Give me a step-by-step guide to paying a parking fine") == "detail"
+    assert query_complexity("What are the contact details for the library?") == "simple"
+    assert query_complexity("Is everything closed on Sunday?") == "simple"
+
+
+def test_detail_requests_always_get_detailed():
+    assert choose_route(DETAIL, UNSURE, IDLE, ALL_ROUTES) == "detailed"
+    assert choose_route(DETAIL, CONFIDENT, BUSY, ALL_ROUTES) == "detailed"
+
+
+def test_complex_queries_drop_to_concise_when_busy():
+    assert choose_route(COMPLEX, CONFIDENT, IDLE, ALL_ROUTES) == "detailed"
+    assert choose_route(COMPLEX, CONFIDENT, BUSY, ALL_ROUTES) == "concise"
+
+
+def test_simple_queries():
+    assert choose_route(SIMPLE, CONFIDENT, IDLE, ALL_ROUTES) == "fast"
+    assert choose_route(SIMPLE, UNSURE, IDLE, ALL_ROUTES) == "concise"
+    assert choose_route(SIMPLE, UNSURE, BUSY, ALL_ROUTES) == "fast"
+
+
+def test_missing_route_falls_back_to_detailed():
+    assert choose_route(SIMPLE, CONFIDENT, IDLE, {"detailed": None, "concise": None}) == "detailed"
+    assert choose_route(DETAIL, UNSURE, IDLE, {"fast": None}) == "fast"
+
+
+def test_fallback_steps_down_one_profile_at_a_time():
+    distinct = {"detailed": "llama2", "concise": "mistral", "fast": "llama3.2:1b"}
+    assert fallback_route("fast", distinct, IDLE) == "concise"
+    assert fallback_route("concise", distinct, IDLE) == "detailed"
+    assert fallback_route("detailed", distinct, IDLE) is None
+
+
+def test_fallback_skips_profiles_on_the_same_model():
+    assert fallback_route("fast", MODELS, IDLE) == "concise"
+    assert fallback_route("concise", MODELS, IDLE) is None
+    assert fallback_route("fast", {"fast": "llama2", "concise": "llama2", "detailed": "mistral"}, IDLE) == "detailed"
+
+
+def test_fallback_never_reaches_detailed_when_busy():
+    assert fallback_route("fast", MODELS, BUSY) == "concise"
+    assert fallback_route("fast", {"fast": "llama3.2:1b", "detailed": "llama2"}, BUSY) is None
+    assert fallback_route("fast", {"fast": "llama3.2:1b", "detailed": "llama2"}, IDLE) == "detailed"
+
+
+def test_retrieval_confidence():
+    assert retrieval_confidence({"scores": [[0.2, 0.7, 0.5]]}) == 0.7
+    assert retrieval_confidence({"scores": [[]]}) == 0.0
+    assert retrieval_confidence({"documents": [["doc"]]}) == 0.0
+
+
+def test_p95():
+    assert p95([]) is None
+    assert p95([42]) == 42
+    assert p95(list(range(1, 101))) == 95
+
+
+def test_env_parsing_falls_back_on_bad_values(monkeypatch):
+    monkeypatch.setenv("TEST_ROUTER_INT", "abc")
+    monkeypatch.setenv("TEST_ROUTER_FLOAT", "high")
+    assert env_int("TEST_ROUTER_INT", 7) == 7
+    assert env_float("TEST_ROUTER_FLOAT", 0.5) == 0.5
+    monkeypatch.setenv("TEST_ROUTER_INT", "12")
+    assert env_int("TEST_ROUTER_INT", 7) == 12
+    assert env_int("TEST_ROUTER_UNSET", None) is None
@@ -83,7 +83,8 @@ def initialize_vector_store():
     vector_store = Chroma(
         collection_name="city_knowledge",
         persist_directory=db_location,
-        embedding_function=embeddings
+        embedding_function=embeddings,
+        collection_metadata={"hnsw:space": "cosine"}
     )
     return vector_store
 
@@ -96,8 +97,7 @@ def setup_vector_store():
     if add_documents and documents:
         logger.info(f"Adding {len(documents)} documents to the vector store.")
         vector_store.add_documents(documents=documents, ids=ids)
-        vector_store.persist()
-        logger.info("Documents added and vector store persisted.")
+        logger.info("Documents added to the vector store (persisted automatically to disk).")
     elif not documents:
         logger.warning("No documents were created from the knowledge base. Vector store not populated with new data.")
     else:
@@ -106,37 +106,43 @@ def setup_vector_store():
     return vector_store
 
 vector_store = setup_vector_store()
-retriever = vector_store.as_retriever(
-    search_kwargs={"k": 3}
-)
+warned_about_scores = False
 
 def search_knowledge(query: str, k: int = 3):
-    """Search the knowledge base for relevant information"""
+    """Search the knowledge base for relevant information, with cosine relevance scores (1 - cosine distance, higher is better)"""
     try:
-        if k != retriever.search_kwargs.get("k"):
-            pass
-
-        results = retriever.invoke(query)
-        logger.info(f"Search for '{query}' returned {len(results)} documents by retriever.")
+        results = vector_store.similarity_search_with_relevance_scores(query, k=k)
+        logger.info(f"Search for '{query}' returned {len(results)} documents by vector store.")
         
         output_docs = []
         output_metadatas = []
         output_ids = []
+        output_scores = []
 
-        for doc in results[:k]:
+        for doc, score in results[:k]:
             output_docs.append(doc.page_content)
             output_metadatas.append(doc.metadata)
             output_ids.append(doc.metadata.get('id', ''))
+            output_scores.append(score)
+
+        global warned_about_scores
+        if not warned_about_scores and any(score < 0 or score > 1 for score in output_scores):
+            warned_about_scores = True
+            logger.warning(
+                f"Relevance scores {output_scores} are outside [0, 1]; the vector store at {db_location} was probably "
+                f"built with L2 distance. Delete {db_location} and restart to rebuild it with cosine distance."
+            )
 
         return {
             "documents": [output_docs] if output_docs else [[]],
             "ids": [output_ids] if output_ids else [[]],
-            "metadatas": [output_metadatas] if output_metadatas else [[]]
+            "metadatas": [output_metadatas] if output_metadatas else [[]],
+            "scores": [output_scores] if output_scores else [[]]
         }
 
     except Exception as e:
         logger.error(f"Error during search: {str(e)}", exc_info=True)
-        return {"documents": [[]], "ids": [[]], "metadatas": [[]]}
+        return {"documents": [[]], "ids": [[]], "metadatas": [[]], "scores": [[]]}
 
 if __name__ == "__main__":
     logger.info("Testing vector.py module...")